@@ -2,9 +2,39 @@
 # Johns Hopkins University
 # May 2014
 
+import collections
 import numpy as np
 import networkx as nx
 
+_POPCOUNT = np.array([bin(ii).count('1') for ii in range(256)], dtype=int)
+
+def rowSumsPacked(P):
+    """Row sums of a binary matrix stored as np.packbits(X, axis=-1)
+
+    Args:
+        P: uint8 array of packed rows, possibly with leading batch axes
+
+    Return:
+        integer array with the popcount of each packed row
+    """
+    return np.sum(_POPCOUNT[np.asarray(P, dtype=np.uint8)], axis=-1)
+
+def colSumsPacked(P, n):
+    """Column sums of a binary matrix stored as np.packbits(X, axis=-1)
+
+    Args:
+        P: uint8 array of packed rows, possibly with leading batch axes
+        n: number of columns in the unpacked matrix
+
+    Return:
+        integer array with the sum of each of the n columns
+    """
+    P = np.asarray(P, dtype=np.uint8)
+    c = np.zeros(P.shape[:-2] + (8 * P.shape[-1],), dtype=int)
+    for bit in range(8):
+        c[..., bit::8] = np.sum((P >> (7 - bit)) & 1, axis=-2)
+    return c[..., :n]
+
 class Margins(object):
     """Set of margins for a contingency table sampling instance.
 
@@ -23,6 +53,7 @@ class Margins(object):
     Methods:
         isFeasible: True if there is a matrix with these row and column sums
         check(X): True if the numpy array X has row sums r and column sums c
+        checkPacked(P): check for a binary matrix packed with np.packbits
     """
     r=np.array([])
     c=np.array([])
@@ -47,6 +78,13 @@ class Margins(object):
             and (np.all(np.sum(Y,axis=1).transpose() == self.r))
             and np.all(Y >= 0))
             #transpose b/c np.matrix differentiates between column and row vectors
+
+    def checkPacked(self, P):
+        """Check if the binary matrix packed as np.packbits(X, axis=1) has 
+        these margins"""
+
+        return (np.all(rowSumsPacked(P) == self.r) and
+                np.all(colSumsPacked(P, self.n) == self.c))
                 
 class MarginsWithCellBounds(Margins):
     """Margins for contingency table instance with cell bounds
@@ -127,6 +165,112 @@ class MarginsWithCellBounds(Margins):
         
         return (super(MarginsWithCellBounds, self).check(X) 
                 and np.all(X <= self.B))
+
+    def checkPacked(self, P):
+        """Check if the binary matrix packed as np.packbits(X, axis=1) has 
+        these margins and satisfies the cell bounds"""
+
+        allowed = np.packbits(np.array(self.B).reshape(self.m, self.n) > 0,
+                              axis=1)
+        return (super(MarginsWithCellBounds, self).checkPacked(P) and
+                not np.any(np.asarray(P, dtype=np.uint8) & ~allowed))
+
+    def presolve(self):
+        """Reduce the instance by removing trivial rows, columns, and cells
+
+        The reduction repeats the following steps until nothing changes:
+            (1) Cell bounds larger than the row sum are lowered to the row sum
+            (2) Rows and columns with sum zero are removed
+            (3) A row whose sum equals the total of its cell bounds (or a
+                column whose sum equals the total of its cell bounds) is 
+                saturated, so each of its cells is fixed to its bound
+        The remaining columns are then grouped into classes of equivalent
+        columns, i.e. columns with the same sum and the same cell bounds.
+        The margins are assumed to be feasible.
+
+        Return:
+            PresolvedMargins describing the reduced instance
+        """
+
+        r = np.array(self.r, dtype=int)
+        c = np.array(self.c, dtype=int)
+        B = np.array(self.B, dtype=int).reshape(self.m, self.n)
+        fixed = np.zeros((self.m, self.n), dtype=int)
+
+        changed = True
+        while changed:
+            Bold = B.copy()
+            B = np.minimum(B, r[:, np.newaxis])
+            B[:, c == 0] = 0
+            forced = ((r[:, np.newaxis] >= np.sum(B, axis=1)[:, np.newaxis]) |
+                      (c >= np.sum(B, axis=0))) & (B > 0)
+            F = np.where(forced, B, 0)
+            fixed += F
+            r -= np.sum(F, axis=1)
+            c -= np.sum(F, axis=0)
+            B -= F
+            changed = not np.array_equal(B, Bold)
+
+        rows = np.flatnonzero(r > 0)
+        classes = collections.OrderedDict()
+        for jj in np.flatnonzero(c > 0):
+            key = (c[jj], tuple(B[rows, jj]))
+            classes.setdefault(key, []).append(jj)
+        cols = [jj for members in classes.values() for jj in members]
+
+        return PresolvedMargins(self, rows, cols,
+                                [len(members) for members in classes.values()],
+                                r[rows], c[cols], B[np.ix_(rows, cols)], fixed)
+
+class PresolvedMargins(MarginsWithCellBounds):
+    """Reduced instance produced by MarginsWithCellBounds.presolve
+
+    The reduced instance keeps the rows and columns of the original instance
+    that are not trivial, with the values fixed by the presolve subtracted
+    from the margins.  The columns are ordered so that each class of
+    equivalent columns is contiguous.
+
+    Args:
+        original: MarginsWithCellBounds that was reduced
+        rows: indices of the original rows that remain
+        cols: indices of the original columns that remain, ordered by class
+        mult: number of columns in each class
+        row_sums: reduced row sums
+        col_sums: reduced column sums
+        cell_bounds: reduced cell bounds
+        fixed: original-shape array of the values fixed by the presolve
+
+    Vars:
+        classSums: sum of each column in each class
+        classBounds: cell bounds with one column per class
+
+    Methods:
+        expand(X): original-shape matrix from a matrix X for the reduced
+                   instance
+    """
+
+    def __init__(self, original, rows, cols, mult, row_sums, col_sums,
+                 cell_bounds, fixed):
+        super(PresolvedMargins, self).__init__(row_sums, col_sums,
+                        np.array(cell_bounds, dtype=int).reshape(len(rows),
+                                                                 len(cols)))
+        self.original = original
+        self.rows = np.array(rows, dtype=int)
+        self.cols = np.array(cols, dtype=int)
+        self.mult = np.array(mult, dtype=int)
+        self.fixed = np.array(fixed, dtype=int)
+
+        first = np.cumsum(self.mult) - self.mult
+        self.classSums = self.c[first]
+        self.classBounds = self.B[:, first]
+
+    def expand(self, X):
+        """Return the original-shape matrix (as a list of lists) for X"""
+
+        Y = self.fixed.copy()
+        Y[np.ix_(self.rows, self.cols)] += np.array(X, dtype=int).reshape(
+                                                        self.m, self.n)
+        return Y.tolist()
                 
 def load(name):
     """Load an instance by name"""
@@ -2,17 +2,94 @@
 
 Classes:
    Sampler: abstract base class for samplers
+   BoundedExactRowsExpectedColumns: sample bounded contingency tables
+   PresolvedBoundedExactRowsExpectedColumns: sample bounded contingency
+       tables after presolving the margins
    BinaryExactRowsExpectedColumns: sample binary contingency tables
 
+Functions:
+   fitBatch: fit samplers to many instances at once
+
 """
 from abc import ABCMeta, abstractmethod
 import contable.margins as margins
 from random import random
+from math import exp
+from bisect import bisect_left
 from scipy.optimize import fsolve
 import collections
+import multiprocessing
+import warnings
 import numpy as np
 import pdb
 
+def _classPolynomial(w, mult, b, k):
+    """Coefficients of (1 + w x + ... + (w x)^b)^mult up to degree k
+
+    Coefficient s is the total weight of all the ways to place s in mult
+    interchangeable cells with weight w and bound b.  The weight is folded
+    in before multiplying, so the coefficients stay finite even when the
+    number of ways alone would overflow.
+    """
+
+    top = min(b, k)
+    base = np.zeros(k+1)
+    base[:top+1] = w ** np.arange(top+1)
+    poly = np.zeros(k+1)
+    poly[0] = 1.0
+    while mult > 0:
+        if mult % 2:
+            poly = np.convolve(poly, base)[:k+1]
+        mult //= 2
+        if mult:
+            base = np.convolve(base, base)[:k+1]
+    return poly.tolist()
+
+def _logCompositionTable(mult, b, k):
+    """Log-count the ways to write 0,1,...,k as a sum of integers in [0,b]
+
+    Return:
+        cnt: array where entry j,s is the log of the number of ways to write
+            s as an ordered sum of j integers in [0,b], for 0 <= j <= mult
+            (-inf where there are none)
+    """
+
+    top = min(b, k)
+    prev = np.full(k+1, -np.inf)
+    prev[0] = 0.0
+    cnt = [prev.tolist()]
+    for ii in range(mult):
+        shifted = np.full((top+1, k+1), -np.inf)
+        for x in range(top+1):
+            shifted[x, x:] = prev[:k+1-x]
+        prev = np.logaddexp.reduce(shifted, axis=0)
+        cnt.append(prev.tolist())
+    return cnt
+
+def _spreadUniformly(total, mult, b, cnt):
+    """Uniformly random list of mult integers in [0,b] that sum to total
+
+    Args:
+        total: sum of the list
+        mult: length of the list
+        b: bound on each integer
+        cnt: _logCompositionTable(mult', b, k) for some mult' >= mult,
+            k >= total
+    """
+
+    row = []
+    for ii in range(mult, 0, -1):
+        top = min(b, total)
+        U = random()
+        X = 0
+        p = exp(cnt[ii-1][total] - cnt[ii][total])
+        while U > p and X < top:
+            X += 1
+            p += exp(cnt[ii-1][total-X] - cnt[ii][total])
+        total -= X
+        row.append(X)
+    return row
+
 class Sampler(object):
     """ Abstract base class for sampling algorithms
 
@@ -75,10 +152,15 @@ class BoundedExactRowsExpectedColumns(Sampler):
     
     Args:
         marg:MarginsWithCellBounds describing the instance
+        index: if True, precompute the conditional distribution of every
+            cell so that each cell is drawn with one uniform and a binary
+            search (uses memory proportional to the cell bounds)
+        w: optional weights, e.g. from fitBatch, to use instead of solving
         
     Vars:
         w: array of margins.n weights for the sampling
         table: dynamic programming table
+        index: precomputed conditional CDFs for each table, or None
         
     Methods:
         colMeans: expected sum of each column
@@ -86,6 +168,8 @@ class BoundedExactRowsExpectedColumns(Sampler):
     """
     w = []
     table = []
+    index = None
+    compositions = None
 
     def colMeans(self):
         """Return the expected sum of each column"""
@@ -138,7 +222,18 @@ class BoundedExactRowsExpectedColumns(Sampler):
         w = fsolve(f, np.array(self.margins.c,dtype=float))
         return w
 
-    def _computeTable(self, w, k, b):
+    def _compositions(self, mult, b, k):
+        """Return _logCompositionTable(mult, b, k), cached by (mult, b)"""
+
+        if self.compositions is None:
+            self.compositions = {}
+        cnt = self.compositions.get((mult, b))
+        if cnt is None or len(cnt[0]) <= k:
+            cnt = _logCompositionTable(mult, b, k)
+            self.compositions[(mult, b)] = cnt
+        return cnt
+
+    def _computeTable(self, w, k, b, mult=None):
         """Create a dynamic programming table for weighted subset sampling
         
         The weight of a subset is the product of the weights of its elements.
@@ -149,6 +244,8 @@ class BoundedExactRowsExpectedColumns(Sampler):
             w: array of weights
             k: maximum size subset to consider
             b: array with bounds on number of times to take each element
+            mult: optional array of multiplicities, element i stands for
+                mult[i] interchangeable elements with weight w_i and bound b_i
             
         Return:
             t: array where entry i,j is the total weight of all j-element
@@ -159,27 +256,90 @@ class BoundedExactRowsExpectedColumns(Sampler):
         n = len(w)
         for ii in range(n):
             tii = [ t[-1][0] ]
-            for jj in range(1,k+1):
-                acc = 0.0
-                mul = 1.0
-                for bb in range(1+np.min((jj,b[n-1-ii]))):
-                    acc += t[-1][jj-bb] * mul
-                    mul *= w[n-1-ii]
-                tii.append(acc)
+            if mult is None or mult[n-1-ii] == 1:
+                for jj in range(1,k+1):
+                    acc = 0.0
+                    mul = 1.0
+                    for bb in range(1+np.min((jj,b[n-1-ii]))):
+                        acc += t[-1][jj-bb] * mul
+                        mul *= w[n-1-ii]
+                    tii.append(acc)
+            else:
+                poly = _classPolynomial(w[n-1-ii], mult[n-1-ii], b[n-1-ii], k)
+                for jj in range(1,k+1):
+                    acc = 0.0
+                    for bb in range(1+np.min((jj,mult[n-1-ii]*b[n-1-ii]))):
+                        acc += poly[bb] * t[-1][jj-bb]
+                    tii.append(acc)
             t.append(tii)
         t.reverse()
         return t
 
-    def __init__(self, marg):
+    def _computeIndex(self, w, table, b, mult=None):
+        """Precompute the conditional CDF of each entry for walking a table
+
+        Args:
+            w: array of weights used to compute table
+            table: dynamic programming table from _computeTable
+            b: array of bounds used to compute table
+            mult: optional array of multiplicities used to compute table
+
+        Return:
+            index: array where index[j][l] is the normalized CDF of entry j
+                given that l remains to be placed in entries j,j+1,...
+        """
+
+        n = len(table)-1
+        k = len(table[0])-1
+        if mult is None:
+            mult = [1]*n
+        index = []
+        for colj in range(n):
+            poly = _classPolynomial(w[colj], mult[colj], b[colj], k)
+            cdfs = []
+            for remaining in range(k+1):
+                cdf = [0.0]
+                if table[colj][remaining] > 0:
+                    cdf = []
+                    acc = 0.0
+                    for X in range(1 + np.min((remaining, mult[colj]*b[colj]))):
+                        acc += poly[X] * table[colj+1][remaining-X]
+                        cdf.append(acc)
+                    cdf = [p / acc for p in cdf]
+                cdfs.append(cdf)
+            index.append(cdfs)
+        return index
+
+    def __init__(self, marg, index=False, w=None):
         """Solve for the weights and initialize the table"""
         
         self.margins = marg
-        self.w = self._computeWeights()
+        if w is None:
+            self.w = self._computeWeights()
+        else:
+            self.w = np.array(w, dtype=float)
         self.table = []
         for rowi in range(self.margins.m):
             self.table.append(self._computeTable(self.w, 
                                                  self.margins.r[rowi], 
                                                  self.margins.B[rowi]))
+        if index:
+            self.index = []
+            for rowi in range(self.margins.m):
+                self.index.append(self._computeIndex(self.w, self.table[rowi],
+                                                     self.margins.B[rowi]))
+
+    def _sampleIndexedRow(self, rowsum, index):
+        """Sample one row of the matrix with the precomputed CDFs"""
+
+        remaining = rowsum
+        row = [0]*len(index)
+        for colj in range(len(index)):
+            cdf = index[colj][remaining]
+            X = min(bisect_left(cdf, random()), len(cdf)-1)
+            remaining -= X
+            row[colj] = X
+        return row
                                                  
     def _sampleRow(self, rowsum, table): 
         """Sample one row of the matrix by randomly walking its table"""
@@ -205,21 +365,194 @@ class BoundedExactRowsExpectedColumns(Sampler):
         
         mat = []
         for rowi in range(self.margins.m):
-            mat.append(self._sampleRow(self.margins.r[rowi],self.table[rowi]))
+            if self.index is None:
+                mat.append(self._sampleRow(self.margins.r[rowi],self.table[rowi]))
+            else:
+                mat.append(self._sampleIndexedRow(self.margins.r[rowi],
+                                                  self.index[rowi]))
         return mat
 
+class PresolvedBoundedExactRowsExpectedColumns(BoundedExactRowsExpectedColumns):
+    """Sample bounded contingency tables after presolving the margins
+
+    Samples from the same distribution as BoundedExactRowsExpectedColumns,
+    but first reduces the instance with MarginsWithCellBounds.presolve.
+    Equivalent columns share one weight, so the root-finding is over one
+    weight per column class and the dynamic programming runs over classes
+    rather than columns.  Each sample is expanded back to the shape of the
+    original instance.
+
+    Args:
+        marg:MarginsWithCellBounds describing the instance
+        index: if True, precompute the conditional distribution of every
+            class total
+        w: optional class weights, e.g. from fitBatch, to use instead of
+            solving
+
+    Vars:
+        reduced: PresolvedMargins for the reduced instance
+        classWeights: one weight per column class
+        w: array of margins.n weights.  Columns removed by the presolve
+           get the placeholder weight 1; their limiting weight is really 0
+           (zero columns) or infinite (saturated columns), so these entries
+           should not be used.
+        table: dynamic programming table for each row of the reduced instance
+        polynomials: _classPolynomial of each class, for each row
+        compositions: log composition counts for each (class size, bound)
+    """
+
+    def __init__(self, marg, index=False, w=None):
+        """Presolve, solve for the class weights, and initialize the table"""
+
+        self.margins = marg
+        self.reduced = marg.presolve()
+        self.compositions = {}
+        k = max(self.reduced.r) if self.reduced.m > 0 else 0
+        for rowi in range(self.reduced.m):
+            for (mult, b) in zip(self.reduced.mult,
+                                 self.reduced.classBounds[rowi]):
+                self._compositions(mult, b, k)
+        if w is None:
+            self.classWeights = self._computeWeights()
+        else:
+            self.classWeights = np.array(w, dtype=float)
+        self.w = np.ones(self.margins.n)
+        self.w[self.reduced.cols] = np.repeat(self.classWeights,
+                                              self.reduced.mult)
+        self.table = []
+        self.polynomials = []
+        for rowi in range(self.reduced.m):
+            self.table.append(self._computeTable(self.classWeights,
+                                                 self.reduced.r[rowi],
+                                                 self.reduced.classBounds[rowi],
+                                                 self.reduced.mult))
+            self.polynomials.append([_classPolynomial(wc, mult, b,
+                                                      self.reduced.r[rowi])
+                                     for (wc, mult, b) in
+                                     zip(self.classWeights, self.reduced.mult,
+                                         self.reduced.classBounds[rowi])])
+        if index:
+            self.index = []
+            for rowi in range(self.reduced.m):
+                self.index.append(self._computeIndex(self.classWeights,
+                                                     self.table[rowi],
+                                                     self.reduced.classBounds[rowi],
+                                                     self.reduced.mult))
+
+    def colMeans(self):
+        """Return the expected sum of each column of the original instance"""
+
+        c = np.sum(self.reduced.fixed, axis=0).astype(float)
+        c[self.reduced.cols] += np.repeat(self._computeColMeans(self.classWeights),
+                                          self.reduced.mult)
+        return c.tolist()
+
+    def _computeColMeans(self, w):
+        """Expected sum of a column in each class for given class weights
+
+        As in the parent class, but the class colj is moved to the front
+        and the probability that the class receives bb in total counts
+        every way of spreading bb over the columns of the class.
+        """
+
+        w = list(w)
+        red = self.reduced
+        mult = list(red.mult)
+        c = [0.0] * len(w)
+        for colj in range(len(w)):
+            for rowi in range(red.m):
+                ri = red.r[rowi]
+                Bi = list(red.classBounds[rowi])
+                t = self._computeTable(w[colj:(colj+1)] + w[0:colj] + w[(colj+1):],
+                                   ri,
+                                   Bi[colj:(colj+1)] + Bi[0:colj] + Bi[(colj+1):],
+                                   mult[colj:(colj+1)] + mult[0:colj] + mult[(colj+1):])
+                poly = _classPolynomial(w[colj], mult[colj], Bi[colj], ri)
+                for bb in range(1, 1 + np.min([mult[colj] * Bi[colj], ri])):
+                    c[colj] += bb * poly[bb] * t[1][ri-bb] / t[0][ri]
+            c[colj] /= mult[colj]
+        return c
+
+    def _computeWeights(self):
+        """Find one weight per column class that meets the column sums"""
+
+        target = np.array(self.reduced.classSums, dtype=float)
+        if len(target) == 0:
+            return target
+
+        #start from the odds of the share of each column's capacity that it
+        #uses, large classes overflow the tables when started at the sums
+        capacity = np.sum(np.minimum(self.reduced.classBounds,
+                                     self.reduced.r[:, np.newaxis]), axis=0)
+        share = np.clip(target / np.maximum(capacity, 1), 0.01, 0.99)
+
+        def f(w):
+            return np.array(self._computeColMeans(w)) - target
+        return fsolve(f, share / (1 - share))
+
+    def _sampleRow(self, rowsum, table, bounds, polys):
+        """Sample one row of the reduced matrix
+
+        Walk the table to choose the total for each class, then spread the
+        total uniformly over the columns of the class.
+        """
+
+        remaining = rowsum
+        mult = self.reduced.mult
+        row = []
+        for colj in range(len(mult)):
+            top = min(mult[colj] * bounds[colj], remaining)
+            U = random()
+            X = 0
+            p = table[colj+1][remaining] / table[colj][remaining]
+            while U > p and X < top:
+                X += 1
+                p += (polys[colj][X] * table[colj+1][remaining-X] /
+                      table[colj][remaining])
+            remaining -= X
+            row += _spreadUniformly(X, mult[colj], bounds[colj],
+                                    self._compositions(mult[colj], bounds[colj], X))
+        return row
+
+    def sample(self):
+        """Sample a matrix with independent rows"""
+
+        mat = []
+        for rowi in range(self.reduced.m):
+            if self.index is None:
+                mat.append(self._sampleRow(self.reduced.r[rowi], self.table[rowi],
+                                           self.reduced.classBounds[rowi],
+                                           self.polynomials[rowi]))
+            else:
+                totals = self._sampleIndexedRow(self.reduced.r[rowi],
+                                                self.index[rowi])
+                row = []
+                for colj in range(len(totals)):
+                    mult = self.reduced.mult[colj]
+                    b = self.reduced.classBounds[rowi][colj]
+                    row += _spreadUniformly(totals[colj], mult, b,
+                                            self._compositions(mult, b, totals[colj]))
+                mat.append(row)
+        return self.reduced.expand(mat)
+
 class BinaryExactRowsExpectedColumns(BoundedExactRowsExpectedColumns):
     """Sampling binary matrics with given row sums and column sums in expectation
     
     A specialization of BoundedEx...umns to the case where the bounds are all 1.
     Some speed is gained because only one dynamic programming table must be
     maintained (rather than margins.m of them)
+
+    Methods:
+        samplePacked: sample one matrix as bit-packed rows
+        samplesPacked: sample n matrices as bit-packed rows
     """
     
-    def __init__(self,marg):
+    def __init__(self, marg, index=False):
         self.margins = marg
         self.w = self._computeWeights()
         self.table = self._computeTable(self.w, max(self.margins.r), [1]*self.margins.n)
+        if index:
+            self.index = self._computeIndex(self.w, self.table, [1]*self.margins.n)
         
     def _computeColMeans(self,w):
         """Compute column means using the fact that rows with identical sums make identical contributions"""
@@ -238,5 +571,251 @@ class BinaryExactRowsExpectedColumns(BoundedExactRowsExpectedColumns):
     def sample(self):
         mat = []
         for rowsum in self.margins.r:
-            mat.append(self._sampleRow(rowsum,self.table))
-        return mat
\ No newline at end of file
+            if self.index is None:
+                mat.append(self._sampleRow(rowsum,self.table))
+            else:
+                mat.append(self._sampleIndexedRow(rowsum,self.index))
+        return mat
+
+    def samplesPacked(self, n, rng=None):
+        """Sample n matrices with rows packed as np.packbits(X, axis=1)
+
+        All n matrices are generated together, one row at a time, by walking
+        the table with vectors of remaining row sums, and each draw is set
+        straight into its bit of the packed array.  The uniforms come from
+        numpy rather than the random module, so random.seed does not make
+        the output reproducible; pass a seeded rng (or use np.random.seed)
+        instead.
+
+        Args:
+            n: number of matrices
+            rng: optional np.random.Generator, defaults to np.random
+
+        Return:
+            uint8 array with shape (n, margins.m, ceil(margins.n / 8))
+        """
+
+        if rng is None:
+            rng = np.random
+        T = np.array(self.table)
+        P = np.zeros((n, self.margins.m, (self.margins.n + 7) // 8),
+                     dtype=np.uint8)
+        for rowi in range(self.margins.m):
+            remaining = np.full(n, self.margins.r[rowi], dtype=int)
+            for colj in range(self.margins.n):
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    p = T[colj+1][remaining] / T[colj][remaining] #Pr(jth entry = 0)
+                draw = rng.random(n) > p
+                P[:, rowi, colj // 8] |= (draw.astype(np.uint8) <<
+                                          np.uint8(7 - colj % 8))
+                remaining -= draw
+        return P
+
+    def samplePacked(self, rng=None):
+        """Sample one matrix with rows packed as np.packbits(X, axis=1)"""
+
+        return self.samplesPacked(1, rng)[0]
+
+def _convolveTruncated(a, b, k):
+    """Product of stacked polynomials a and b, truncated to degree k"""
+
+    t = np.zeros(np.broadcast(a, b).shape)
+    for ii in range(k+1):
+        t[..., ii:] += a[..., ii:ii+1] * b[..., :k+1-ii]
+    return t
+
+def _batchColMeans(w, r, B):
+    """Expected column sums for a stack of instances with the same shape
+
+    The same quantity as BoundedExactRowsExpectedColumns.colMeans, computed
+    for every instance at once.  Row rowi of an instance has generating
+    polynomial prod_j sum_{bb <= B[rowi][colj]} (w[colj] x)^bb, and the
+    contribution of column colj is read off the product of the polynomials
+    of the other columns, which is built from prefix and suffix products.
+
+    Args:
+        w: (S,n) array of weights
+        r: (S,m) integer array of row sums
+        B: (S,m,n) integer array of cell bounds
+
+    Return:
+        c: (S,n) array of expected column sums
+    """
+
+    S, m, n = B.shape
+    k = int(np.max(r)) if r.size else 0
+    bb = np.arange(k+1)
+    P = np.where(bb <= B[..., np.newaxis],
+                 w[:, np.newaxis, :, np.newaxis] **
+                 np.minimum(bb, B[..., np.newaxis]), 0.0)
+    one = np.zeros((S, m, k+1))
+    one[..., 0] = 1.0
+    suffix = [one]
+    for colj in range(n-1, -1, -1):
+        suffix.append(_convolveTruncated(P[:, :, colj, :], suffix[-1], k))
+    suffix.reverse()
+    total = np.take_along_axis(suffix[0], r[..., np.newaxis], axis=2)[..., 0]
+
+    c = np.zeros((S, n))
+    prefix = one
+    for colj in range(n):
+        others = _convolveTruncated(prefix, suffix[colj+1], k)
+        for bb in range(1, k+1):
+            rest = r - bb
+            t = np.take_along_axis(others, np.maximum(rest, 0)[..., np.newaxis],
+                                   axis=2)[..., 0]
+            c[:, colj] += np.sum(np.where(rest >= 0, 
+                                          bb * P[:, :, colj, bb] * t / total,
+                                          0.0), axis=1)
+        prefix = _convolveTruncated(prefix, P[:, :, colj, :], k)
+    return c
+
+def _normalizeWeights(w, c):
+    """Scale the weights of the columns with a positive sum to geometric
+    mean 1
+
+    Every row sum is exact, so a common factor on an instance's weights
+    does not change its distribution; fixing the scale keeps the weights
+    from drifting off towards overflow.
+    """
+
+    free = (c > 0) & (w > 0)
+    logw = np.log(np.where(free, w, 1.0))
+    g = np.sum(logw, axis=-1) / np.maximum(np.sum(free, axis=-1), 1)
+    return np.where(free, w * np.exp(-g)[..., np.newaxis], w)
+
+def _solveWeights(w, r, c, B):
+    """Polish the weights of one padded instance with fsolve
+
+    The root-finding is over log-weights of the columns with a positive
+    sum, so the weights stay positive.  The first of these log-weights is
+    held fixed to pin the scale, and its equation is dropped since the
+    expected column sums always add up to the sum of the row sums.
+    """
+
+    w = _normalizeWeights(w, c)
+    free = np.flatnonzero(c > 0)
+    if len(free) <= 1:
+        return w
+    v0 = np.log(w[free])
+
+    def f(v):
+        x = np.zeros(len(c))
+        x[free] = np.exp(np.concatenate((v0[:1], v)))
+        return (_batchColMeans(x[np.newaxis], r[np.newaxis], B[np.newaxis])[0]
+                - c)[free[1:]]
+    v = fsolve(f, v0[1:], full_output=True)[0]
+    w = np.zeros(len(c))
+    w[free] = np.exp(np.concatenate((v0[:1], v)))
+    return _normalizeWeights(w, c)
+
+def _batchWeights(args):
+    """Solve for the weights of a stack of instances by iterative scaling
+
+    Each weight is repeatedly multiplied by the ratio of its target column
+    sum to its current expected column sum, for all instances at once, and
+    then each instance is rescaled with _normalizeWeights.
+    Instances stop updating once they are within tol, and those still off
+    after maxiter iterations are finished one at a time with fsolve.
+
+    Return:
+        w: (S,n) array of weights
+        converged: (S,) boolean array, True where the column sums are
+            within tol
+    """
+
+    r, c, B, tol, maxiter = args
+    w = _normalizeWeights(np.array(c, dtype=float), c)
+    active = np.ones(len(w), dtype=bool)
+    for ii in range(maxiter):
+        mu = _batchColMeans(w[active], r[active], B[active])
+        done = np.all(np.abs(mu - c[active]) < tol, axis=1)
+        ratio = np.divide(c[active], mu, out=np.ones_like(mu), where=mu > 0)
+        w[active] = np.where(done[:, np.newaxis], w[active],
+                             _normalizeWeights(np.where(c[active] > 0,
+                                                        w[active] * ratio, 0.0),
+                                               c[active]))
+        active[np.flatnonzero(active)[done]] = False
+        if not np.any(active):
+            break
+
+    for ii in np.flatnonzero(active):
+        w[ii] = _solveWeights(w[ii], r[ii], c[ii], B[ii])
+    converged = np.all(np.abs(_batchColMeans(w, r, B) - c) < tol, axis=1)
+    return (w, converged)
+
+def fitBatch(margs, index=False, processes=None, tol=1e-8, maxiter=100):
+    """Fit samplers to many instances at once
+
+    Each instance is presolved first.  If the presolve fixes cells, the
+    weights cannot converge for the full instance (some of them tend to 0
+    or infinity), so the reduced instance is fitted instead and the
+    instance gets a PresolvedBoundedExactRowsExpectedColumns.  All other
+    instances get a BoundedExactRowsExpectedColumns.
+
+    The instances to fit are padded to a common shape with zero rows and
+    columns.  Their weights are solved for together with stacked dynamic
+    programming and iterative scaling, instead of one fsolve per instance,
+    and any instance still off after maxiter iterations is finished with
+    fsolve.  A RuntimeWarning lists the instances whose expected column
+    sums are still not within tol, e.g. because they are infeasible.
+
+    Args:
+        margs: list of MarginsWithCellBounds
+        index: passed on to each sampler
+        processes: if given, split the batch across a process pool of
+            this size
+        tol: tolerance on the expected column sums
+        maxiter: maximum number of scaling iterations
+
+    Return:
+        list of fitted samplers, one per instance
+    """
+
+    S = len(margs)
+    if S == 0:
+        return []
+    reduced = [marg.presolve() for marg in margs]
+    fits = [red if np.any(red.fixed) else marg
+            for (marg, red) in zip(margs, reduced)]
+
+    m = max(fit.m for fit in fits)
+    n = max(fit.n for fit in fits)
+    r = np.zeros((S, m), dtype=int)
+    c = np.zeros((S, n), dtype=int)
+    B = np.zeros((S, m, n), dtype=int)
+    for (ii, fit) in enumerate(fits):
+        r[ii, :fit.m] = fit.r
+        c[ii, :fit.n] = fit.c
+        B[ii, :fit.m, :fit.n] = np.array(fit.B).reshape(fit.m, fit.n)
+
+    if processes is None:
+        (w, converged) = _batchWeights((r, c, B, tol, maxiter))
+    else:
+        chunks = np.array_split(np.arange(S), min(processes, S))
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_batchWeights,
+                               [(r[ch], c[ch], B[ch], tol, maxiter)
+                                for ch in chunks])
+        finally:
+            pool.close()
+            pool.join()
+        w = np.concatenate([res[0] for res in results])
+        converged = np.concatenate([res[1] for res in results])
+
+    if not np.all(converged):
+        warnings.warn('fitBatch: column sums not within tol for instances ' +
+                      str(list(np.flatnonzero(~converged))), RuntimeWarning)
+
+    sams = []
+    for (ii, (marg, fit)) in enumerate(zip(margs, fits)):
+        if fit is marg:
+            sams.append(BoundedExactRowsExpectedColumns(marg, index=index,
+                                                        w=w[ii, :marg.n]))
+        else:
+            first = np.cumsum(fit.mult) - fit.mult
+            sams.append(PresolvedBoundedExactRowsExpectedColumns(marg,
+                                                        index=index,
+                                                        w=w[ii, first]))
+    return sams
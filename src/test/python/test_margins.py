@@ -2,6 +2,7 @@ import sys
 sys.path.insert(0, './src/main/python')
 
 from contable import *
+import numpy as np
 import unittest
 import contable.margins as margins
 
@@ -124,6 +125,66 @@ class TestMarginsWithCellBounds(unittest.TestCase):
              [0,0,1,0],
              [2,0,0,1]] #does not satisfy the (0,1) cell bound
         self.assertFalse(self.m4.check(M))
+
+    def test_checkPacked(self):
+        """checkPacked should agree with check for packed binary matrices"""
+
+        M = [[1,1,1,0],
+             [1,1,0,1],
+             [1,1,0,0],
+             [1,0,1,0],
+             [0,1,0,1],
+             [1,0,0,0],
+             [0,0,1,0],
+             [0,0,0,1]]
+        P = np.packbits(np.array(M, dtype=bool), axis=1)
+        self.assertTrue(np.array_equal(margins.rowSumsPacked(P), np.sum(M,axis=1)))
+        self.assertTrue(np.array_equal(margins.colSumsPacked(P, 4), np.sum(M,axis=0)))
+        self.assertTrue(self.m5.check(M))
+        self.assertTrue(self.m5.checkPacked(P))
+
+        M = [[1,0,0,0],
+             [0,0,1,0],
+             [0,1,0,1]]
+        m = margins.MarginsWithCellBounds([1,1,2],[1,1,1,1],[[1,1,1,1],
+                                                            [1,0,1,1],
+                                                            [1,1,1,1]])
+        self.assertTrue(m.checkPacked(np.packbits(np.array(M, dtype=bool), axis=1)))
+        M = [[1,0,0,0],
+             [0,1,0,0],
+             [0,0,1,1]] #does not satisfy the (1,1) cell bound
+        self.assertFalse(m.checkPacked(np.packbits(np.array(M, dtype=bool), axis=1)))
+
+    def test_presolve(self):
+        """presolve should remove trivial rows, columns, and cells and group
+        equivalent columns
+        """
+        P = self.m5.presolve()
+        self.assertTrue(np.array_equal(P.rows, range(8)))
+        self.assertTrue(np.array_equal(P.cols, range(4)))
+        self.assertTrue(np.array_equal(P.mult, [1,1,2]))
+        self.assertTrue(np.array_equal(P.classSums, [5,4,3]))
+
+        #row 3 is zero, column 4 is zero, column 1 is saturated once row 3
+        #is removed, and columns 0 and 2 become equivalent
+        m = margins.MarginsWithCellBounds([2,1,3,0],[1,2,1,2,0],
+                                          [[1,1,1,2,1],
+                                           [1,0,1,4,1],
+                                           [3,1,6,1,1],
+                                           [1,1,1,1,1]])
+        P = m.presolve()
+        self.assertTrue(np.array_equal(P.rows, [0,1,2]))
+        self.assertTrue(np.array_equal(P.cols, [0,2,3]))
+        self.assertTrue(np.array_equal(P.mult, [2,1]))
+        self.assertTrue(np.array_equal(P.r, [1,1,2]))
+        self.assertTrue(np.array_equal(P.classBounds, [[1,1],[1,1],[2,1]]))
+        self.assertTrue(np.array_equal(P.fixed[:,1], [1,0,1,0]))
+        self.assertFalse(m.check(P.expand([[1,0,0],
+                                           [0,1,0],
+                                           [0,0,2]])))
+        self.assertTrue(m.check(P.expand([[1,0,0],
+                                          [0,0,1],
+                                          [0,1,1]])))
         
         
 if __name__ == '__main__':
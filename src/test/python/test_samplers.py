@@ -4,6 +4,7 @@ sys.path.insert(0, './src/main/python')
 from contable import *
 import numpy as np
 import unittest
+import warnings
 import contable.margins as margins
 import contable.samplers as samplers
 import contable.tabletools as tabletools
@@ -99,7 +100,220 @@ class TestBoundedExactRowsExpectedColumns(unittest.TestCase):
         print('')
         
         return 0
+
+    def test_index(self):
+        """The precomputed CDFs should agree with the table"""
+
+        for m in self.m:
+            sam = samplers.BoundedExactRowsExpectedColumns(m, index=True)
+            self.assertEqual(len(sam.index), m.m)
+            for (ri,table,index) in zip(m.r,sam.table,sam.index):
+                for colj in range(m.n):
+                    for rem in range(ri+1):
+                        cdf = index[colj][rem]
+                        self.assertTrue(np.all(np.diff(cdf) >= 0))
+                        if table[colj][rem] > 0:
+                            self.assertAlmostEqual(cdf[-1], 1.0)
+                            self.assertAlmostEqual(cdf[0], 
+                                        table[colj+1][rem] / table[colj][rem])
+
+        print('')
+        print('H0: sampling distribution is correct')
+        print('HA: sampling distribution is not correct')
+        for ii in [0,1,2]:
+            sam = samplers.BoundedExactRowsExpectedColumns(self.m[ii], index=True)
+            print('Indexed table instance ' + str(ii) + 
+            ' chi-square test p-value: ' + '{:.3f}'.format(
+                            tabletools.test_this_sampler(sam, 10000)))
+        print('')
                     
+class TestFitBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.m = [margins.MarginsWithCellBounds([3,2,1],[2,2,1,1],1),
+                  margins.MarginsWithCellBounds([2,2,2,2],[2,2,2,2],[[0,1,1,1],
+                                                                     [1,0,1,1],
+                                                                     [1,1,0,1],
+                                                                     [1,1,1,0]]),
+                  margins.MarginsWithCellBounds([2,1,3],[2,2,1,1],[[1,1,1,2],
+                                                                   [1,4,1,0],
+                                                                   [2,1,6,1]]),
+                  margins.MarginsWithCellBounds([2,2],[1,2,1],[[1,1,1],
+                                                               [1,2,1]])]
+
+    def test_fitBatch(self):
+        """fitBatch should agree with fitting each instance separately
+
+        Weights are only determined up to a common factor.
+        """
+
+        for processes in [None, 2]:
+            sams = samplers.fitBatch(self.m, processes=processes)
+            self.assertEqual(len(sams), len(self.m))
+            for (m,sam) in zip(self.m,sams):
+                self.assertEqual(m, sam.margins)
+                self.assertTrue(np.allclose(sam.colMeans(), m.c))
+                w = samplers.BoundedExactRowsExpectedColumns(m).w
+                self.assertTrue(np.allclose(sam.w / sam.w[0], w / w[0]))
+        self.assertEqual(samplers.fitBatch([]), [])
+
+    def test_fitBatch_mixed(self):
+        """Every instance of a mixed batch should be fitted within tol
+
+        The batch has random shapes and bounds, so it includes instances
+        where the presolve fixes cells and instances that iterative scaling
+        does not finish within maxiter.
+        """
+
+        rng = np.random.RandomState(0)
+        #the first instance is fixed by the presolve, the second is not
+        #fitted by iterative scaling within maxiter
+        ms = [margins.MarginsWithCellBounds([1,2],[1,1,1],[[1,1,1],
+                                                           [0,1,2]]),
+              margins.MarginsWithCellBounds([4,3,2,7,8],[2,5,2,5,7,3],
+                                            [[1,2,3,3,1,2],
+                                             [0,3,1,1,1,2],
+                                             [0,2,1,0,2,2],
+                                             [1,1,2,1,3,2],
+                                             [1,2,3,2,1,3]])]
+        for ii in range(60):
+            B = rng.randint(0, 4, (rng.randint(2, 6), rng.randint(2, 7)))
+            X = rng.randint(0, 4, B.shape) % (B + 1)
+            ms.append(margins.MarginsWithCellBounds(np.sum(X,axis=1),
+                                                    np.sum(X,axis=0), B))
+
+        tol = 1e-8
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            sams = samplers.fitBatch(ms, tol=tol)
+        self.assertIsInstance(sams[0],
+                              samplers.PresolvedBoundedExactRowsExpectedColumns)
+        self.assertIsInstance(sams[1], samplers.BoundedExactRowsExpectedColumns)
+        self.assertNotIsInstance(sams[1],
+                              samplers.PresolvedBoundedExactRowsExpectedColumns)
+        for (m,sam) in zip(ms,sams):
+            self.assertLess(np.max(np.abs(np.array(sam.colMeans()) - m.c)), tol)
+
+    def test_fitBatch_scale(self):
+        """A batch that mixes small and large row sums should be fitted
+        without numerical warnings, with weights of geometric mean 1
+        """
+
+        rng = np.random.RandomState(0)
+        ms = []
+        for ii in range(100):
+            B = rng.randint(0, 4, (4, 5))
+            X = rng.randint(0, 4, B.shape) % (B + 1)
+            ms.append(margins.MarginsWithCellBounds(np.sum(X,axis=1),
+                                                    np.sum(X,axis=0), B))
+        ms.append(margins.MarginsWithCellBounds([30,30],[20,20,20],20))
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            sams = samplers.fitBatch(ms)
+        for (m,sam) in zip(ms,sams):
+            self.assertLess(np.max(np.abs(np.array(sam.colMeans()) - m.c)), 1e-8)
+            if not isinstance(sam, samplers.PresolvedBoundedExactRowsExpectedColumns):
+                free = np.array(m.c) > 0
+                self.assertAlmostEqual(np.mean(np.log(sam.w[free])), 0.0)
+
+    def test_fitBatch_warns(self):
+        """fitBatch should warn about instances that cannot be fitted"""
+
+        #infeasible: column 1 needs a 1 but its only cell has bound 0
+        ms = self.m + [margins.MarginsWithCellBounds([2],[1,1],[[1,0]])]
+        with self.assertWarns(RuntimeWarning):
+            sams = samplers.fitBatch(ms)
+        self.assertEqual(len(sams), len(ms))
+
+class TestPresolvedBoundedExactRowsExpectedColumns(unittest.TestCase):
+
+    def setUp(self):
+        self.m = [margins.MarginsWithCellBounds([3,2,1],[2,2,1,1],1),
+                  margins.MarginsWithCellBounds([2,1,3],[2,2,1,1],[[1,1,1,2],
+                                                                   [1,4,1,0],
+                                                                   [2,1,6,1]]),
+                  margins.MarginsWithCellBounds([4,4,3],[2,2,2,2,2,1],2)]
+        self.sam = []
+        for mii in self.m:
+            self.sam.append(samplers.PresolvedBoundedExactRowsExpectedColumns(mii))
+
+    def test_w(self):
+        """The weights should agree with the sampler without presolve
+
+        Weights are only determined up to a common factor.
+        """
+
+        for (m,sam) in zip(self.m,self.sam):
+            w = samplers.BoundedExactRowsExpectedColumns(m).w
+            self.assertEqual(len(sam.classWeights), len(sam.reduced.mult))
+            self.assertTrue(np.allclose(sam.w / sam.w[0], w / w[0]))
+
+    def test_colMeans(self):
+        """colMeans should give the original column sums, including the
+        columns removed by the presolve
+        """
+
+        for sam in self.sam:
+            self.assertTrue(np.allclose(sam.colMeans(), sam.margins.c))
+
+        #column 1 is saturated and column 4 is zero
+        m = margins.MarginsWithCellBounds([2,1,3,0],[1,2,1,2,0],
+                                          [[1,1,1,2,1],
+                                           [1,0,1,4,1],
+                                           [3,1,6,1,1],
+                                           [1,1,1,1,1]])
+        sam = samplers.PresolvedBoundedExactRowsExpectedColumns(m)
+        self.assertEqual(len(sam.reduced.cols), 3)
+        self.assertTrue(np.allclose(sam.colMeans(), m.c))
+
+    def test_sample_large_class(self):
+        """Sampling a large class should only use the cached composition
+        counts, and a class too large for plain counts should still work
+        """
+
+        m = margins.MarginsWithCellBounds([10,10,10],[1]*30,1)
+        counted = []
+        logCompositionTable = samplers._logCompositionTable
+        def counting(mult, b, k):
+            counted.append((mult, b, k))
+            return logCompositionTable(mult, b, k)
+        samplers._logCompositionTable = counting
+        try:
+            for index in [False, True]:
+                sam = samplers.PresolvedBoundedExactRowsExpectedColumns(m, index=index)
+                self.assertTrue(np.array_equal(sam.reduced.mult, [30]))
+                self.assertEqual(list(sam.compositions.keys()), [(30, 1)])
+                del counted[:]
+                X = np.array(sam.samples(200))
+                self.assertEqual(counted, [])
+                self.assertTrue(np.all(np.sum(X, axis=2) == 10))
+                self.assertTrue(np.all(X <= 1))
+        finally:
+            samplers._logCompositionTable = logCompositionTable
+
+        #C(2500,250) does not fit in a float
+        m = margins.MarginsWithCellBounds([250]*10,[1]*2500,1)
+        sam = samplers.PresolvedBoundedExactRowsExpectedColumns(m)
+        self.assertTrue(np.allclose(sam.colMeans(), m.c))
+        X = np.array(sam.samples(5))
+        self.assertTrue(np.all(np.sum(X, axis=2) == 250))
+        self.assertTrue(np.all((X == 0) | (X == 1)))
+
+    def test_sample(self):
+        """Sample many matrices and test that the distribution is correct"""
+
+        print('')
+        print('H0: sampling distribution is correct')
+        print('HA: sampling distribution is not correct')
+        for ii in [0,1]:
+            print('Presolved table instance ' + str(ii) + 
+            ' chi-square test p-value: ' + '{:.3f}'.format(
+                            tabletools.test_this_sampler( self.sam[ii], 10000)))
+        print('')
+        
+        return 0
+
 class TestBinaryExactRowsExpectedColumns(unittest.TestCase):
     
     def setUp(self):
@@ -122,4 +336,20 @@ class TestBinaryExactRowsExpectedColumns(unittest.TestCase):
                             tabletools.test_this_sampler( self.sam[ii], 10000)))
         print('')
         
-        return 0
\ No newline at end of file
+        return 0
+
+    def test_samplesPacked(self):
+        """Packed samples should have the correct row sums and column means"""
+
+        for (m,sam) in zip(self.m,self.sam):
+            P = sam.samplesPacked(20000)
+            self.assertEqual(P.shape, (20000, m.m, (m.n + 7) // 8))
+            self.assertEqual(P.dtype, np.uint8)
+            self.assertTrue(np.all(margins.rowSumsPacked(P) == m.r))
+            c = np.mean(margins.colSumsPacked(P, m.n), axis=0)
+            self.assertTrue(np.allclose(c, m.c, atol=0.05))
+            X = np.unpackbits(sam.samplePacked(), axis=1)[:, :m.n]
+            self.assertTrue(np.all(X.sum(axis=1) == m.r))
+            self.assertTrue(np.array_equal(
+                            sam.samplesPacked(100, np.random.default_rng(7)),
+                            sam.samplesPacked(100, np.random.default_rng(7))))
\ No newline at end of file